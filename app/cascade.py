@@ -0,0 +1,95 @@
+import time
+import threading
+from typing import Dict, List, Any, Optional, Callable
+from app.deadline import Deadline
+
+class TierStats:
+    def __init__(self, model: str):
+        self.model = model
+        self.calls = 0
+        self.accepted = 0
+        self.escalated = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.escalation_reasons: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "escalated": self.escalated,
+            "rejected": self.rejected,
+            "hit_rate": self.accepted / self.calls if self.calls else 0.0,
+            "avg_latency_ms": (self.total_latency / self.calls) * 1000 if self.calls else 0.0,
+            "escalation_reasons": dict(self.escalation_reasons)
+        }
+
+class ModelCascade:
+    """Runs a call on the cheapest model first and escalates to the next tier
+    when the validator rejects the result or the input is too long."""
+
+    def __init__(self, models: List[str], max_chars: int, min_confidence: float):
+        self.models = models
+        self.max_chars = max_chars
+        self.min_confidence = min_confidence
+        self.tiers = [TierStats(model) for model in models]
+        self.long_input_skips = 0
+        self._lock = threading.Lock()
+
+    def run(self, text_length: int,
+            call: Callable[[str], Optional[Dict[str, Any]]],
+            validate: Callable[[Dict[str, Any]], Optional[str]],
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        first_tier = 0
+        if text_length > self.max_chars:
+            first_tier = len(self.tiers) - 1
+            with self._lock:
+                self.long_input_skips += 1
+
+        result = None
+        for i in range(first_tier, len(self.tiers)):
+            tier = self.tiers[i]
+            previous = result
+
+            # keep the cheaper result rather than escalating past the deadline
+            if previous is not None and deadline is not None and deadline.expired():
+                return previous
+
+            start = time.perf_counter()
+            try:
+                result = call(tier.model)
+            except Exception:
+                # a failed or timed-out escalation still leaves the cheaper answer
+                if previous is None:
+                    raise
+                return previous
+            latency = time.perf_counter() - start
+
+            reason = "invalid_json" if result is None else validate(result)
+            is_last = i == len(self.tiers) - 1
+
+            with self._lock:
+                tier.calls += 1
+                tier.total_latency += latency
+                if reason is None:
+                    tier.accepted += 1
+                else:
+                    # the last tier has nowhere to escalate; count it as rejected
+                    if is_last:
+                        tier.rejected += 1
+                    else:
+                        tier.escalated += 1
+                    tier.escalation_reasons[reason] = tier.escalation_reasons.get(reason, 0) + 1
+
+            if reason is None or is_last:
+                return result
+
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "long_input_skips": self.long_input_skips,
+                "tiers": [tier.to_dict() for tier in self.tiers]
+            }
@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Callable, TypeVar, Optional, Tuple
+from app.deadline import Deadline, DeadlineExceeded
+
+BREAKER_ENABLED = os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "15"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Trips open when too many of the recent calls failed or were slow,
+    rejects calls while open, and lets a single probe through after
+    open_seconds to decide whether to close again."""
+
+    def __init__(self, enabled: bool = BREAKER_ENABLED, window: int = BREAKER_WINDOW,
+                 min_calls: int = BREAKER_MIN_CALLS, failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+                 open_seconds: float = BREAKER_OPEN_SECONDS,
+                 is_failure: Optional[Callable[[Exception], bool]] = None):
+        self.enabled = enabled
+        # decides whether an error says something about the provider's health
+        self.is_failure = is_failure or (lambda error: True)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    def _before_call(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+
+            if self.state == CLOSED:
+                return False
+
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.rejected += 1
+            raise CircuitOpenError(f"LLM circuit is {self.state}; skipping call")
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+
+    def _record(self, is_probe: bool, failed: bool, slow: bool) -> None:
+        with self._lock:
+            if is_probe:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._trip()
+                else:
+                    self.state = CLOSED
+                return
+
+            if self.state != CLOSED:
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._trip()
+
+    def _on_deadline(self, is_probe: bool, start: float) -> None:
+        # our own time budget ran out; only count it against the provider
+        # when the call had already been waiting long enough to be slow
+        if time.monotonic() - start >= self.slow_call_seconds:
+            self._record(is_probe, failed=False, slow=True)
+        elif is_probe:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def _on_error(self, error: BaseException, is_probe: bool, start: float, deadline: Optional[Deadline]) -> None:
+        # timeouts caused by a caller's deadline must never count as provider
+        # failures, or one client with a tight deadline trips it for everyone
+        if isinstance(error, DeadlineExceeded) or (deadline is not None and deadline.expired()):
+            self._on_deadline(is_probe, start)
+        elif not isinstance(error, Exception) or not self.is_failure(error):
+            # cancelled or closed by our side (e.g. a client disconnect), or
+            # rejected because of the request itself rather than the provider
+            if is_probe:
+                with self._lock:
+                    self._probe_in_flight = False
+        else:
+            self._record(is_probe, failed=True, slow=False)
+
+    def acquire(self) -> Tuple[bool, float]:
+        """Start a call whose outcome is reported later with release();
+        raises CircuitOpenError while open. Returns (is_probe, start)."""
+        is_probe = self._before_call() if self.enabled else False
+        return is_probe, time.monotonic()
+
+    def release(self, is_probe: bool, start: float, error: Optional[BaseException] = None,
+                deadline: Optional[Deadline] = None) -> None:
+        if not self.enabled:
+            return
+
+        if error is not None:
+            self._on_error(error, is_probe, start, deadline)
+        else:
+            self._record(is_probe, failed=False, slow=time.monotonic() - start >= self.slow_call_seconds)
+
+    def call(self, fn: Callable[[], T], deadline: Optional[Deadline] = None) -> T:
+        is_probe, start = self.acquire()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.release(is_probe, start, e, deadline)
+            raise
+
+        self.release(is_probe, start)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "state": self.state,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "window_calls": len(self._outcomes),
+                "window_failures": sum(1 for f, _ in self._outcomes if f)
+            }
@@ -1,35 +1,73 @@
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from app.llm_service import LLMService
+from app.deadline import Deadline, DeadlineExceeded
+from app.circuit_breaker import CircuitOpenError
 
 class CoherenceAnalyzer:
     def __init__(self):
         self.llm_service = LLMService()
+        self.transition_words = [
+            "however", "therefore", "furthermore", "moreover", "in addition",
+            "consequently", "as a result", "for instance", "for example",
+            "in conclusion", "finally", "thus", "hence", "accordingly",
+            "first", "second", "also", "besides", "on the other hand", "in contrast"
+        ]
+        self.filler_phrases = [
+            "um", "uh", "like", "you know", "i mean", "kind of", "sort of",
+            "i guess", "or something", "and stuff", "basically", "actually"
+        ]
     
-    def analyze_coherence(self, text: str, topic: str) -> Dict[str, Any]:
+    def analyze_coherence(self, text: str, topic: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         try:
-            result = self.llm_service.analyze_coherence(text, topic)
+            result = self.llm_service.analyze_coherence(text, topic, deadline)
             
-            coherence_feedback = result.get("coherence_feedback", "No coherence feedback available.")
-            coherence_score = result.get("score", 0.5)
-            
-            try:
-                coherence_score = float(coherence_score)
-                coherence_score = max(0.0, min(1.0, coherence_score))
-            except (ValueError, TypeError):
-                coherence_score = 0.5
-            
-            return {
-                "feedback": coherence_feedback,
-                "score": coherence_score
-            }
+            return self.process_result(result)
             
+        except DeadlineExceeded:
+            raise
+        except CircuitOpenError:
+            return self.analyze_locally(text, topic)
         except Exception as e:
             print(f"Error in coherence analysis: {str(e)}")
-            return {
-                "feedback": "Unable to analyze coherence due to an error.",
-                "score": 0.5
-            }
+            return self.analyze_locally(text, topic)
+    
+    def analyze_locally(self, text: str, topic: str) -> Dict[str, Any]:
+        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+        
+        metrics = {
+            "sentence_count": len(sentences),
+            "transition_word_count": self._count_transition_words(text),
+            "filler_phrase_count": self._count_filler_phrases(text),
+            "topic_relevance": self._calculate_topic_relevance(text, topic),
+            "sentence_flow": self._analyze_sentence_flow(sentences),
+            "repetition": self._analyze_repetition(text),
+            "avg_sentence_length": sum(len(s.split()) for s in sentences) / max(1, len(sentences))
+        }
+        
+        score = self._calculate_coherence_score(metrics)
+        
+        return {
+            "feedback": self._generate_coherence_feedback(metrics, score),
+            "score": score,
+            "degraded": True
+        }
+    
+    def process_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        coherence_feedback = result.get("coherence_feedback", "No coherence feedback available.")
+        coherence_score = result.get("score", 0.5)
+        
+        try:
+            coherence_score = float(coherence_score)
+            coherence_score = max(0.0, min(1.0, coherence_score))
+        except (ValueError, TypeError):
+            coherence_score = 0.5
+        
+        return {
+            "feedback": coherence_feedback,
+            "score": coherence_score,
+            "degraded": False
+        }
     
 ################# EXTRA FUNCTIONS #################
     def _count_transition_words(self, text: str) -> int:
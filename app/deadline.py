@@ -0,0 +1,31 @@
+import os
+import time
+from typing import Optional
+
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "60000"))
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Deadline:
+    def __init__(self, timeout: float):
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_ms(cls, deadline_ms: Optional[int] = None) -> "Deadline":
+        # a client may ask for less time than the server allows, never more
+        if deadline_ms is None or deadline_ms > REQUEST_DEADLINE_MS:
+            deadline_ms = REQUEST_DEADLINE_MS
+        return cls(max(0, deadline_ms) / 1000)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        return remaining
@@ -1,37 +1,154 @@
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Optional, AsyncIterator
 import re
-from app.utils import merge_overlapping_errors
+from app.utils import merge_overlapping_errors, span_matches
 from app.llm_service import LLMService
+from app.deadline import Deadline, DeadlineExceeded
+from app.circuit_breaker import CircuitOpenError
 
 class GrammarChecker:
     def __init__(self):
         self.llm_service = LLMService()
     
-    def check_grammar(self, text: str) -> Tuple[List[Dict[str, Any]], str]:
+    def check_grammar(self, text: str, deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], str]:
+        result = self.analyze_grammar(text, deadline)
+        
+        return result["errors"], result["feedback"]
+    
+    def analyze_grammar(self, text: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         try:
-            result = self.llm_service.analyze_grammar(text)
+            result = self.llm_service.analyze_grammar(text, deadline)
+            errors, grammar_feedback = self.process_result(result)
             
-            errors = result.get("errors", [])
-            grammar_feedback = result.get("grammar_feedback", "No grammar feedback available.")
+            return {
+                "errors": errors,
+                "feedback": grammar_feedback,
+                "degraded": False
+            }
             
-            for error in errors:
-                if "start" not in error or "end" not in error or \
-                   "wrong_version" not in error or "correct_version" not in error:
+        except DeadlineExceeded:
+            raise
+        except CircuitOpenError:
+            errors, grammar_feedback = self.analyze_locally(text)
+        except Exception as e:
+            print(f"Error in grammar analysis: {str(e)}")
+            errors, grammar_feedback = self.analyze_locally(text)
+        
+        return {
+            "errors": errors,
+            "feedback": grammar_feedback,
+            "degraded": True
+        }
+    
+    async def stream_grammar(self, text: str, deadline: Optional[Deadline] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {"type": "error", "error": ...} events as the model emits
+        them, then a final {"type": "result", ...} event holding exactly the
+        streamed errors plus feedback, in the same shape as analyze_grammar."""
+        streamed = []
+        
+        try:
+            async for kind, payload in self.llm_service.stream_grammar(text, deadline):
+                if kind == "error":
+                    error = self._normalize_error(payload, text)
+                    # overlapping errors would be merged away in the result,
+                    # so only forward the ones the client can keep
+                    if error is not None and not any(
+                        error["start"] < other["end"] and error["end"] > other["start"] for other in streamed
+                    ):
+                        streamed.append(error)
+                        yield {"type": "error", "error": error}
                     continue
                 
-                try:
-                    error["start"] = int(error["start"])
-                    error["end"] = int(error["end"])
-                except (ValueError, TypeError):
-                    continue
+                yield {
+                    "type": "result",
+                    "errors": sorted(streamed, key=lambda e: e["start"]),
+                    "feedback": payload.get("grammar_feedback", "No grammar feedback available."),
+                    "degraded": False,
+                    "partial": False
+                }
+            return
+        
+        except DeadlineExceeded:
+            grammar_feedback = "Grammar analysis did not finish before the request deadline."
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                print(f"Error in grammar analysis: {str(e)}")
             
-            merged_errors = merge_overlapping_errors(errors)
+            if not streamed:
+                errors, grammar_feedback = self.analyze_locally(text)
+                for error in errors:
+                    yield {"type": "error", "error": error}
+                yield {
+                    "type": "result",
+                    "errors": errors,
+                    "feedback": grammar_feedback,
+                    "degraded": True,
+                    "partial": False
+                }
+                return
             
-            return merged_errors, grammar_feedback
+            grammar_feedback = "Grammar analysis was interrupted before it finished."
+        
+        yield {
+            "type": "result",
+            "errors": sorted(streamed, key=lambda e: e["start"]),
+            "feedback": grammar_feedback,
+            "degraded": False,
+            "partial": True
+        }
+    
+    def _normalize_error(self, error: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+        if "start" not in error or "end" not in error or \
+           "wrong_version" not in error or "correct_version" not in error:
+            return None
+        
+        try:
+            error["start"] = int(error["start"])
+            error["end"] = int(error["end"])
+        except (ValueError, TypeError):
+            return None
+        
+        if not span_matches(text, error["start"], error["end"], str(error["wrong_version"])):
+            return None
+        
+        return error
+    
+    def analyze_locally(self, text: str) -> Tuple[List[Dict[str, Any]], str]:
+        # only the fixed-phrase rules are precise enough to show students; the
+        # agreement and a/an patterns misfire on correct English ("a bus")
+        errors = (
+            self._check_uncountable_articles(text) +
+            self._check_preposition_errors(text)
+        )
+        errors = [
+            error for error in errors
+            if error["correct_version"].lower() != error["wrong_version"].lower()
+        ]
+        
+        merged_errors = merge_overlapping_errors(errors)
+        
+        return merged_errors, self._generate_grammar_feedback(text, merged_errors)
+    
+    def feedback_for(self, text: str, errors: List[Dict[str, Any]]) -> str:
+        return self._generate_grammar_feedback(text, errors)
+    
+    def process_result(self, result: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], str]:
+        errors = result.get("errors", [])
+        grammar_feedback = result.get("grammar_feedback", "No grammar feedback available.")
+        
+        for error in errors:
+            if "start" not in error or "end" not in error or \
+               "wrong_version" not in error or "correct_version" not in error:
+                continue
             
-        except Exception as e:
-            print(f"Error in grammar analysis: {str(e)}")
-            return [], "Unable to analyze grammar due to an error."
+            try:
+                error["start"] = int(error["start"])
+                error["end"] = int(error["end"])
+            except (ValueError, TypeError):
+                continue
+        
+        merged_errors = merge_overlapping_errors(errors)
+        
+        return merged_errors, grammar_feedback
     
 ################# EXTRA FUNCTIONS #################
     def _check_plural_singular_agreement(self, text: str) -> List[Dict[str, Any]]:
@@ -85,11 +202,7 @@ class GrammarChecker:
             (r'\ba\s+([aeiou][a-z]*)\b', lambda m: "an " + m.group(1)),
             
             # Incorrect article usage with consonant sounds
-            (r'\ban\s+([bcdfghjklmnpqrstvwxyz][a-z]*)\b', lambda m: "a " + m.group(1)),
-            
-            # Unnecessary articles with uncountable nouns
-            (r'\b(a|an)\s+(information|advice|knowledge|furniture|news|equipment|traffic|weather|homework|luggage|money)\b',
-             lambda m: m.group(2))
+            (r'\ban\s+([bcdfghjklmnpqrstvwxyz][a-z]*)\b', lambda m: "a " + m.group(1))
         ]
         
         for pattern, replacement in patterns:
@@ -109,6 +222,22 @@ class GrammarChecker:
                         "correct_version": correction
                     })
         
+        return errors + self._check_uncountable_articles(text)
+    
+    def _check_uncountable_articles(self, text: str) -> List[Dict[str, Any]]:
+        errors = []
+        
+        # Unnecessary articles with uncountable nouns
+        pattern = r'\b(a|an)\s+(information|advice|knowledge|furniture|news|equipment|traffic|weather|homework|luggage|money)\b'
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            start, end = match.span()
+            errors.append({
+                "start": start,
+                "end": end,
+                "wrong_version": text[start:end],
+                "correct_version": match.group(2)
+            })
+        
         return errors
     
     def _check_preposition_errors(self, text: str) -> List[Dict[str, Any]]:
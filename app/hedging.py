@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Optional, Callable, TypeVar
+from app.deadline import Deadline, DeadlineExceeded
+
+HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_WORKERS = int(os.getenv("LLM_HEDGE_MAX_WORKERS", "16"))
+
+T = TypeVar("T")
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+class HedgedExecutor:
+    """Runs a call with the time left on the deadline and, once enough
+    latencies have been observed, fires a duplicate when the first attempt
+    runs past the observed percentile, returning whichever finishes first.
+
+    Only the duplicates use the bounded pool, and one is skipped rather than
+    queued when every worker is busy, so a saturated pool never delays the
+    first attempt or piles more load on a slow provider."""
+
+    def __init__(self, enabled: bool = HEDGING_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, max_workers: int = HEDGE_MAX_WORKERS):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge") if enabled else None
+        self._hedge_slots = threading.BoundedSemaphore(max_workers)
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+        self.deadline_exceeded = 0
+
+    def _tracker(self, key: str) -> LatencyTracker:
+        with self._lock:
+            if key not in self._trackers:
+                self._trackers[key] = LatencyTracker()
+            return self._trackers[key]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def run(self, key: str, call: Callable[[Optional[float]], T], deadline: Optional[Deadline] = None) -> T:
+        self._count("calls")
+        tracker = self._tracker(key)
+
+        def timed_call() -> T:
+            start = time.perf_counter()
+            result = call(deadline.remaining() if deadline is not None else None)
+            tracker.record(time.perf_counter() - start)
+            return result
+
+        if deadline is not None and deadline.expired():
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded("Request deadline exceeded before the LLM call was made")
+
+        hedge_after = tracker.percentile(self.percentile) if len(tracker) >= self.min_samples else None
+        if self._pool is None or hedge_after is None:
+            return timed_call()
+
+        # the first attempt starts right away on its own thread: the calling
+        # thread has to stay free to return a hedge that finishes first
+        primary: Future = Future()
+
+        def run_primary() -> None:
+            primary.set_running_or_notify_cancel()
+            try:
+                primary.set_result(timed_call())
+            except BaseException as e:
+                primary.set_exception(e)
+
+        threading.Thread(target=run_primary, name="llm-primary", daemon=True).start()
+        pending = {primary}
+
+        wait_for = hedge_after if deadline is None else min(hedge_after, deadline.remaining())
+        done, _ = wait(pending, timeout=wait_for)
+        if not done and (deadline is None or not deadline.expired()):
+            if self._hedge_slots.acquire(blocking=False):
+                self._count("hedges")
+                hedge = self._pool.submit(timed_call)
+                hedge.add_done_callback(lambda _: self._hedge_slots.release())
+                pending.add(hedge)
+            else:
+                self._count("hedges_skipped")
+
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining() if deadline is not None else None,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded("Request deadline exceeded while waiting for the LLM")
+
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                last_error = future.exception()
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            trackers = dict(self._trackers)
+            stats = {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedges_skipped": self.hedges_skipped,
+                "deadline_exceeded": self.deadline_exceeded
+            }
+        stats["latency_ms"] = {
+            key: {
+                f"p{p}": (tracker.percentile(p) or 0.0) * 1000
+                for p in (50, 95, 99)
+            }
+            for key, tracker in trackers.items()
+        }
+        return stats
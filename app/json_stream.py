@@ -0,0 +1,83 @@
+import json
+from typing import Dict, List, Any, Optional
+
+class ErrorStreamParser:
+    """Incrementally scans a streamed grammar response and returns each
+    entry of the top-level "errors" array as soon as its closing brace
+    arrives, without waiting for the rest of the JSON document."""
+
+    def __init__(self, key: str = "errors"):
+        self.key = key
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.array_closed = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        items = []
+
+        while self._pos < len(self.text):
+            i = self._pos
+            char = self.text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = self.text[self._string_start + 1:i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._current_key == self.key and not self.array_closed:
+                    self._array_depth = self._depth
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = i
+            elif char in "}]":
+                if char == "}" and self._item_start is not None and self._depth == self._array_depth + 1:
+                    item = self._parse_item(self.text[self._item_start:i + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._item_start = None
+                elif char == "]" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._array_depth = None
+                    self.array_closed = True
+                self._depth -= 1
+            elif char == "," and self._depth == 1:
+                self._current_key = None
+
+        return items
+
+    def _parse_item(self, raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        start, end = self.text.find("{"), self.text.rfind("}")
+        if start == -1 or end < start:
+            return None
+        try:
+            result = json.loads(self.text[start:end + 1])
+        except json.JSONDecodeError:
+            return None
+        return result if isinstance(result, dict) else None
@@ -1,23 +1,203 @@
 import os
 import json
-from typing import Dict, List, Any, Optional
+import asyncio
+from typing import Dict, List, Any, Optional, Callable, Tuple, AsyncIterator
 import openai
 from dotenv import load_dotenv
+from app.cascade import ModelCascade
+from app.deadline import Deadline, DeadlineExceeded
+from app.hedging import HedgedExecutor
+from app.circuit_breaker import CircuitBreaker
+from app.prompts import GRAMMAR_TEMPLATE, COHERENCE_TEMPLATE, PACKED_TEMPLATE, PromptTemplate, PromptUsage, estimate_tokens, render_packed_item
+from app.json_stream import ErrorStreamParser
+from app.utils import span_matches, locate_span
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
+# Model cascade: a cheap model handles the first pass and only rejected
+# responses (bad JSON, low confidence, implausible offsets) or long inputs
+# are sent to the stronger STRONG_MODEL.
+FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+STRONG_MODEL = os.getenv("OPENAI_STRONG_MODEL", "gpt-4o")
+CASCADE_ENABLED = os.getenv("LLM_CASCADE_ENABLED", "false").lower() == "true"
+CASCADE_MAX_CHARS = int(os.getenv("LLM_CASCADE_MAX_CHARS", "1500"))
+CASCADE_MIN_CONFIDENCE = float(os.getenv("LLM_CASCADE_MIN_CONFIDENCE", "0.7"))
+
+_cascade = ModelCascade([FAST_MODEL, STRONG_MODEL], CASCADE_MAX_CHARS, CASCADE_MIN_CONFIDENCE)
+_prompt_usage = PromptUsage()
+def _is_provider_failure(error: Exception) -> bool:
+    # 4xx responses (a transcript over the context length, a content filter
+    # hit) are caused by one request and must not open the breaker for all
+    if isinstance(error, openai.APIStatusError):
+        return isinstance(error, openai.RateLimitError) or error.status_code >= 500
+    return True
+
+_hedger = HedgedExecutor()
+_breaker = CircuitBreaker(is_failure=_is_provider_failure)
+_client = None
+_async_client = None
+
+# Calls made under a deadline go through clients without SDK retries: a
+# retry would reuse the same per-attempt timeout and overrun the deadline.
+def _get_client() -> "openai.OpenAI":
+    global _client
+    if _client is None:
+        _client = openai.OpenAI(api_key=openai.api_key, max_retries=0)
+    return _client
+
+def _get_async_client() -> "openai.AsyncOpenAI":
+    global _async_client
+    if _async_client is None:
+        _async_client = openai.AsyncOpenAI(api_key=openai.api_key, max_retries=0)
+    return _async_client
+
+def cascade_stats() -> Dict[str, Any]:
+    return {"enabled": CASCADE_ENABLED, **_cascade.stats()}
+
+def prompt_stats() -> Dict[str, Any]:
+    return _prompt_usage.stats()
+
+def hedging_stats() -> Dict[str, Any]:
+    return _hedger.stats()
+
+def breaker_stats() -> Dict[str, Any]:
+    return _breaker.stats()
+
 class LLMService:
-    def __init__(self, model: Optional[str] = None):
+    def __init__(self, model: Optional[str] = None, use_cascade: Optional[bool] = None):
         self.model = model or DEFAULT_MODEL
         self.api_key_missing = False
         
+        if use_cascade is None:
+            use_cascade = CASCADE_ENABLED and model is None
+        self.cascade = _cascade if use_cascade else None
+        
         if not openai.api_key:
             self.api_key_missing = True
             print("WARNING: OpenAI API key not found. The service will return mock responses.")
     
-    def analyze_grammar(self, text: str) -> Dict[str, Any]:
+    def _send(self, model: str, messages: List[Dict[str, str]], timeout: Optional[float],
+              deadline: Optional[Deadline] = None) -> Any:
+        if timeout is None:
+            return openai.chat.completions.create(
+                model=model,
+                messages=messages
+            )
+        
+        try:
+            return _get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=timeout
+            )
+        except openai.APITimeoutError:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Request deadline exceeded while waiting for the LLM")
+            raise
+    
+    def _record_usage(self, template: PromptTemplate, messages: List[Dict[str, str]], usage: Any) -> None:
+        if usage is None:
+            return
+        
+        details = getattr(usage, "prompt_tokens_details", None)
+        _prompt_usage.record(
+            template,
+            sum(estimate_tokens(message["content"]) for message in messages),
+            usage.prompt_tokens or 0,
+            (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+        )
+    
+    def _request(self, model: str, template: PromptTemplate, messages: List[Dict[str, str]],
+                 deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        response = _breaker.call(lambda: _hedger.run(
+            f"{model}:{template.name}",
+            lambda timeout: self._send(model, messages, timeout, deadline),
+            deadline
+        ), deadline)
+        
+        self._record_usage(template, messages, getattr(response, "usage", None))
+        
+        try:
+            result = json.loads(response.choices[0].message.content)
+        except json.JSONDecodeError:
+            return None
+        
+        return result if isinstance(result, dict) else None
+    
+    def _complete(self, text: str, template: PromptTemplate, messages: List[Dict[str, str]],
+                  validate: Callable[[Dict[str, Any]], Optional[str]],
+                  deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        if self.cascade is None:
+            return self._request(self.model, template, messages, deadline)
+        
+        return self.cascade.run(
+            len(text),
+            lambda model: self._request(model, template, messages, deadline),
+            validate,
+            deadline
+        )
+    
+    def _check_confidence(self, result: Dict[str, Any]) -> Optional[str]:
+        confidence = result.get("confidence")
+        if confidence is None:
+            return None
+        
+        try:
+            confidence = float(confidence)
+        except (ValueError, TypeError):
+            return "invalid_confidence"
+        
+        if confidence < _cascade.min_confidence:
+            return "low_confidence"
+        return None
+    
+    def _check_grammar_schema(self, result: Dict[str, Any]) -> Optional[str]:
+        errors = result.get("errors")
+        if not isinstance(errors, list) or not isinstance(result.get("grammar_feedback"), str):
+            return "invalid_schema"
+        
+        for error in errors:
+            if not isinstance(error, dict) or "correct_version" not in error:
+                return "invalid_schema"
+            
+            try:
+                int(error["start"]), int(error["end"]), str(error["wrong_version"])
+            except (KeyError, ValueError, TypeError):
+                return "invalid_schema"
+        
+        return None
+    
+    def _check_coherence_schema(self, result: Dict[str, Any]) -> Optional[str]:
+        if not isinstance(result.get("coherence_feedback"), str):
+            return "invalid_schema"
+        
+        try:
+            score = float(result.get("score"))
+        except (ValueError, TypeError):
+            return "invalid_schema"
+        
+        if not 0.0 <= score <= 1.0:
+            return "invalid_schema"
+        
+        return None
+    
+    def _validate_grammar(self, text: str, result: Dict[str, Any]) -> Optional[str]:
+        reason = self._check_grammar_schema(result)
+        if reason is not None:
+            return reason
+        
+        for error in result["errors"]:
+            if not span_matches(text, int(error["start"]), int(error["end"]), str(error["wrong_version"])):
+                return "implausible_offsets"
+        
+        return self._check_confidence(result)
+    
+    def _validate_coherence(self, result: Dict[str, Any]) -> Optional[str]:
+        return self._check_coherence_schema(result) or self._check_confidence(result)
+    
+    def analyze_grammar(self, text: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         if self.api_key_missing:
             # Return a mock response if API key is missing
             return {
@@ -25,53 +205,92 @@ class LLMService:
                 "grammar_feedback": "API key missing. Please set the OPENAI_API_KEY environment variable."
             }
             
-        prompt = f"""
-        You are a TOEFL grammar expert. Analyze the following text for grammatical errors:
-
-        TEXT: {text}
-
-        Identify all grammatical errors in the text. For each error, provide:
-        1. The start and end index of the error in the text
-        2. The incorrect text
-        3. The corrected version
-        4. A brief explanation of the error
-
-        IMPORTANT: Your response must be a valid JSON object with the following structure and nothing else:
-        {{
-            "errors": [
-                {{
-                    "start": <start_index>,
-                    "end": <end_index>,
-                    "wrong_version": "<incorrect_text>",
-                    "correct_version": "<corrected_text>",
-                    "explanation": "<brief_explanation>"
-                }}
-            ],
-            "grammar_feedback": "<overall_feedback_on_grammar>"
-        }}
-
-        Ensure that the indices are correct by counting characters from the beginning of the text (0-indexed).
-        Do not include any text outside the JSON structure. Your entire response should be parseable as JSON.
-        """
-        
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a TOEFL grammar expert that analyzes text and returns JSON. Your response MUST be valid JSON and nothing else."},
-                {"role": "user", "content": prompt}
-            ]
+        result = self._complete(
+            text,
+            GRAMMAR_TEMPLATE,
+            GRAMMAR_TEMPLATE.render(text=text),
+            lambda r: self._validate_grammar(text, r),
+            deadline
         )
         
-        try:
-            result = json.loads(response.choices[0].message.content)
-            return result
-        except json.JSONDecodeError:
+        if result is None:
             return {
                 "errors": [],
                 "grammar_feedback": "Unable to analyze grammar due to an error in processing the response."
             }
+        
+        return result
+    
+    async def stream_grammar(self, text: str, deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Stream the grammar analysis, yielding ("error", error) for each
+        entry of the response's errors array as soon as it is complete and
+        finally ("result", result) with the fully parsed response."""
+        if self.api_key_missing:
+            yield "result", {
+                "errors": [],
+                "grammar_feedback": "API key missing. Please set the OPENAI_API_KEY environment variable."
+            }
+            return
+        
+        messages = GRAMMAR_TEMPLATE.render(text=text)
+        kwargs = {"timeout": deadline.check()} if deadline is not None else {}
+        parser = ErrorStreamParser()
+        
+        # the breaker judges the whole stream, not just opening it, so errors
+        # and stalls while reading chunks count too
+        is_probe, started = _breaker.acquire()
+        failure: Optional[BaseException] = None
+        try:
+            try:
+                stream = await _get_async_client().chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **kwargs
+                )
+            except openai.APITimeoutError:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded("Request deadline exceeded while waiting for the LLM")
+                raise
+            
+            chunks = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        if deadline is None:
+                            chunk = await chunks.__anext__()
+                        else:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), deadline.remaining())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceeded("Request deadline exceeded while streaming the LLM response")
+                    
+                    self._record_usage(GRAMMAR_TEMPLATE, messages, getattr(chunk, "usage", None))
+                    
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        for error in parser.feed(chunk.choices[0].delta.content):
+                            yield "error", error
+            finally:
+                await stream.close()
+        except BaseException as e:
+            failure = e
+            raise
+        finally:
+            _breaker.release(is_probe, started, failure, deadline)
+        
+        result = parser.result()
+        if result is None:
+            yield "result", {
+                "errors": [],
+                "grammar_feedback": "Unable to analyze grammar due to an error in processing the response."
+            }
+            return
+        
+        yield "result", result
     
-    def analyze_coherence(self, text: str, topic: str) -> Dict[str, Any]:
+    def analyze_coherence(self, text: str, topic: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         if self.api_key_missing:
             # Return a mock response if API key is missing
             return {
@@ -79,44 +298,78 @@ class LLMService:
                 "score": 0.5
             }
             
-        prompt = f"""
-        You are a TOEFL coherence expert. Analyze the following text for coherence and flow:
-
-        TOPIC: {topic}
-        TEXT: {text}
-
-        Evaluate how well the text flows, whether ideas connect logically, and if the response stays on topic.
-        Consider:
-        1. Logical flow between sentences and paragraphs
-        2. Use of transition words and phrases
-        3. Overall organization and structure
-        4. Relevance to the given topic
-        5. Repetition and redundancy
-
-        IMPORTANT: Your response must be a valid JSON object with the following structure and nothing else:
-        {{
-            "coherence_feedback": "<detailed_feedback_on_coherence>",
-            "score": <coherence_score_between_0_and_1>
-        }}
-
-        The coherence_feedback should be detailed enough to help the student improve their writing.
-        Do not include any text outside the JSON structure. Your entire response should be parseable as JSON.
-        """
-        
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a TOEFL coherence expert that analyzes text and returns JSON. Your response MUST be valid JSON and nothing else."},
-                {"role": "user", "content": prompt}
-            ]
+        result = self._complete(
+            text,
+            COHERENCE_TEMPLATE,
+            COHERENCE_TEMPLATE.render(topic=topic, text=text),
+            self._validate_coherence,
+            deadline
         )
         
-        try:
-            result = json.loads(response.choices[0].message.content)
-            return result
-        except json.JSONDecodeError:
+        if result is None:
             return {
                 "coherence_feedback": "Unable to analyze coherence due to an error in processing the response.",
                 "score": 0.5
             }
-
+        
+        return result
+    
+    def analyze_packed(self, items: List[Tuple[str, str, str]],
+                       deadline: Optional[Deadline] = None) -> Dict[str, Dict[str, Any]]:
+        """Analyze several (item_id, topic, text) transcripts in one request.
+        
+        Returns the parsed section for every item whose grammar and coherence
+        parts have the expected fields; missing or malformed items are left
+        out so the caller can fall back to individual calls for them. Errors
+        whose offsets do not match the text are re-located or dropped.
+        """
+        if self.api_key_missing or not items:
+            return {}
+        
+        texts = {item_id: text for item_id, _, text in items}
+        messages = PACKED_TEMPLATE.render(
+            items="\n\n".join(render_packed_item(item_id, topic, text) for item_id, topic, text in items)
+        )
+        
+        # the cascade's length limit is meant per transcript, not per batch
+        result = self._complete(
+            max(texts.values(), key=len),
+            PACKED_TEMPLATE,
+            messages,
+            lambda r: None if len(self._packed_sections(texts, r)) == len(texts) else "invalid_schema",
+            deadline
+        )
+        
+        if result is None:
+            return {}
+        
+        return self._packed_sections(texts, result)
+    
+    def _packed_sections(self, texts: Dict[str, str], result: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        if not isinstance(result.get("items"), list):
+            return {}
+        
+        sections = {}
+        for section in result["items"]:
+            if not isinstance(section, dict):
+                continue
+            
+            item_id = str(section.get("id"))
+            if item_id not in texts or item_id in sections:
+                continue
+            
+            if self._check_grammar_schema(section) is not None or \
+               self._check_coherence_schema(section) is not None:
+                continue
+            
+            errors = []
+            for error in section["errors"]:
+                span = locate_span(
+                    texts[item_id], int(error["start"]), int(error["end"]), str(error["wrong_version"])
+                )
+                if span is not None:
+                    errors.append({**error, "start": span[0], "end": span[1]})
+            
+            sections[item_id] = {**section, "errors": errors}
+        
+        return sections
@@ -1,6 +1,9 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+import asyncio
 import json
 import sys
 import os
@@ -9,10 +12,20 @@ import os
 try:
     from app.grammar_checker import GrammarChecker
     from app.coherence_analyzer import CoherenceAnalyzer
+    from app.llm_service import cascade_stats, prompt_stats
+    from app.packing import TranscriptPacker, PACKING_ENABLED
+    from app.deadline import Deadline, DeadlineExceeded
+    from app.llm_service import hedging_stats, breaker_stats
+    from app.near_duplicate import NearDuplicateIndex, NEAR_DUP_ENABLED
 except ImportError:
     # Fallback for local development
     from grammar_checker import GrammarChecker
     from coherence_analyzer import CoherenceAnalyzer
+    from llm_service import cascade_stats, prompt_stats
+    from packing import TranscriptPacker, PACKING_ENABLED
+    from deadline import Deadline, DeadlineExceeded
+    from llm_service import hedging_stats, breaker_stats
+    from near_duplicate import NearDuplicateIndex, NEAR_DUP_ENABLED
 
 app = FastAPI(
     title="TOEFL Speaking Transcript Analyzer",
@@ -22,6 +35,12 @@ app = FastAPI(
 
 grammar_checker = GrammarChecker()
 coherence_analyzer = CoherenceAnalyzer()
+near_duplicates = NearDuplicateIndex(grammar_checker)
+packer = TranscriptPacker(
+    grammar_checker, coherence_analyzer,
+    lambda topic, paragraph, deadline: analyze_new_transcript(topic, paragraph, deadline),
+    near_duplicates if NEAR_DUP_ENABLED else None
+)
 
 class TranscriptItem(BaseModel):
     topic: str
@@ -29,6 +48,10 @@ class TranscriptItem(BaseModel):
 
 class TranscriptRequest(BaseModel):
     transcripts: List[TranscriptItem]
+    # pack short transcripts into shared LLM requests; defaults to LLM_PACKING_ENABLED
+    pack: Optional[bool] = None
+    # time budget for the whole request; defaults to and is capped at REQUEST_DEADLINE_MS
+    deadline_ms: Optional[int] = Field(None, gt=0)
 
 class ErrorItem(BaseModel):
     start: int
@@ -41,29 +64,64 @@ class AnalysisResult(BaseModel):
     errors: List[ErrorItem]
     grammar_feedback: str
     coherence_feedback: str
+    # True when the deadline passed before every analysis finished
+    partial: bool = False
+    # True when the LLM was unavailable and local heuristics were used instead
+    degraded: bool = False
 
 class AnalysisResponse(BaseModel):
     results: List[AnalysisResult]
+    partial: bool = False
 
+# a plain def so FastAPI runs the blocking LLM calls in its threadpool
 @app.post("/analyze", response_model=AnalysisResponse)
-async def analyze_transcripts(request: TranscriptRequest) -> Dict[str, Any]:
-    results = []
+def analyze_transcripts(request: TranscriptRequest) -> Dict[str, Any]:
+    deadline = Deadline.from_ms(request.deadline_ms)
+    
+    if request.pack if request.pack is not None else PACKING_ENABLED:
+        results = packer.analyze([(t.topic, t.paragraph) for t in request.transcripts], deadline)
+    else:
+        results = [
+            analyze_transcript_text(transcript.topic, transcript.paragraph, deadline)
+            for transcript in request.transcripts
+        ]
+    
+    return {"results": results, "partial": any(result["partial"] for result in results)}
+
+@app.post("/analyze/stream")
+async def analyze_transcripts_stream(request: TranscriptRequest) -> StreamingResponse:
+    deadline = Deadline.from_ms(request.deadline_ms)
     
-    for transcript in request.transcripts:
-        errors, grammar_feedback = grammar_checker.check_grammar(transcript.paragraph)
-        
-        coherence_analysis = coherence_analyzer.analyze_coherence(
-            transcript.paragraph, transcript.topic
-        )
-        
-        results.append({
-            "topic": transcript.topic,
-            "errors": errors,
-            "grammar_feedback": grammar_feedback,
-            "coherence_feedback": coherence_analysis.get("feedback", "No coherence feedback available.")
-        })
+    async def events() -> AsyncIterator[str]:
+        for index, transcript in enumerate(request.transcripts):
+            # coherence runs alongside the streamed grammar analysis
+            coherence_task = asyncio.ensure_future(run_in_threadpool(
+                analyze_coherence_text, transcript.topic, transcript.paragraph, deadline
+            ))
+            
+            grammar_analysis = None
+            async for event in grammar_checker.stream_grammar(transcript.paragraph, deadline):
+                if event["type"] == "error":
+                    yield json.dumps({"type": "error", "index": index, "error": event["error"]}) + "\n"
+                else:
+                    grammar_analysis = event
+            
+            coherence_analysis = await coherence_task
+            
+            yield json.dumps({
+                "type": "result",
+                "index": index,
+                "result": {
+                    "topic": transcript.topic,
+                    "errors": grammar_analysis["errors"],
+                    "grammar_feedback": grammar_analysis["feedback"],
+                    "coherence_feedback": coherence_analysis["feedback"],
+                    "partial": grammar_analysis["partial"] or coherence_analysis["partial"],
+                    "degraded": grammar_analysis["degraded"] or coherence_analysis["degraded"]
+                }
+            }) + "\n"
     
-    return {"results": results}
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 @app.get("/")
 async def root():
@@ -71,21 +129,74 @@ async def root():
         "name": "TOEFL Speaking Transcript Analyzer",
         "version": "1.0.0",
         "endpoints": {
-            "/analyze": "POST - Analyze TOEFL speaking transcripts"
+            "/analyze": "POST - Analyze TOEFL speaking transcripts",
+            "/analyze/stream": "POST - Stream grammar errors as NDJSON events while transcripts are analyzed",
+            "/stats": "GET - LLM model cascade hit rates, latency percentiles and hedging, prompt token usage, packing counts, circuit breaker state and near-duplicate reuse"
         }
     }
 
-def analyze_transcript_text(topic: str, paragraph: str) -> Dict[str, Any]:
-    errors, grammar_feedback = grammar_checker.check_grammar(paragraph)
-    coherence_analysis = coherence_analyzer.analyze_coherence(paragraph, topic)
+@app.get("/stats")
+async def stats():
+    return {
+        "cascade": cascade_stats(),
+        "prompts": prompt_stats(),
+        "packing": packer.stats(),
+        "hedging": hedging_stats(),
+        "circuit_breaker": breaker_stats(),
+        "near_duplicates": near_duplicates.stats()
+    }
+
+def analyze_transcript_text(topic: str, paragraph: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    if NEAR_DUP_ENABLED:
+        reused = near_duplicates.reuse(topic, paragraph, deadline)
+        if reused is not None:
+            return reused
+    
+    return analyze_new_transcript(topic, paragraph, deadline)
+
+def analyze_new_transcript(topic: str, paragraph: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    # for transcripts with no near-duplicate to reuse; remembers the result for later ones
+    result = analyze_transcript_fresh(topic, paragraph, deadline)
+    if NEAR_DUP_ENABLED:
+        near_duplicates.remember(topic, paragraph, result)
+    
+    return result
+
+def analyze_transcript_fresh(topic: str, paragraph: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    partial = False
+    degraded = False
+    
+    try:
+        grammar_analysis = grammar_checker.analyze_grammar(paragraph, deadline)
+        errors, grammar_feedback = grammar_analysis["errors"], grammar_analysis["feedback"]
+        degraded = grammar_analysis["degraded"]
+    except DeadlineExceeded:
+        errors, grammar_feedback = [], "Grammar analysis did not finish before the request deadline."
+        partial = True
+    
+    coherence_analysis = analyze_coherence_text(topic, paragraph, deadline)
     
     return {
         "topic": topic,
         "errors": errors,
         "grammar_feedback": grammar_feedback,
-        "coherence_feedback": coherence_analysis["feedback"]
+        "coherence_feedback": coherence_analysis["feedback"],
+        "partial": partial or coherence_analysis["partial"],
+        "degraded": degraded or coherence_analysis["degraded"]
     }
 
+def analyze_coherence_text(topic: str, paragraph: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    try:
+        coherence_analysis = coherence_analyzer.analyze_coherence(paragraph, topic, deadline)
+        return {**coherence_analysis, "partial": False}
+    except DeadlineExceeded:
+        return {
+            "feedback": "Coherence analysis did not finish before the request deadline.",
+            "score": 0.5,
+            "degraded": False,
+            "partial": True
+        }
+
 if __name__ == "__main__":
     import uvicorn
     import argparse
@@ -0,0 +1,305 @@
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, List, Any, Tuple, Optional, FrozenSet, TYPE_CHECKING
+from app.deadline import Deadline, DeadlineExceeded
+from app.utils import merge_overlapping_errors, span_matches
+
+if TYPE_CHECKING:
+    from app.grammar_checker import GrammarChecker
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "false").lower() == "true"
+# minimum Jaccard similarity of the two transcripts' word 3-shingles
+NEAR_DUP_MIN_SIMILARITY = float(os.getenv("NEAR_DUP_MIN_SIMILARITY", "0.6"))
+# reuse only when the changed sentences are at most this share of the text
+NEAR_DUP_MAX_CHANGED_FRACTION = float(os.getenv("NEAR_DUP_MAX_CHANGED_FRACTION", "0.3"))
+NEAR_DUP_NUM_PERM = int(os.getenv("NEAR_DUP_NUM_PERM", "128"))
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "1000"))
+NEAR_DUP_MAX_TOPICS = int(os.getenv("NEAR_DUP_MAX_TOPICS", "500"))
+
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = (1 << 61) - 1
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    return [(m.group(0).lower(), m.start(), m.end()) for m in re.finditer(r'\S+', text)]
+
+def shingles(text: str) -> FrozenSet[str]:
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def lsh_parameters(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Pick (bands, rows) with bands * rows == num_perm whose LSH threshold
+    (1 / bands) ** (1 / rows) is the highest one not above threshold, so
+    pairs at the threshold are very likely to share a bucket."""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    if not below:
+        return options[-1]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+class MinHasher:
+    def __init__(self, num_perm: int = NEAR_DUP_NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, shingle_set: FrozenSet[str]) -> Tuple[int, ...]:
+        values = [
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in shingle_set
+        ]
+        return tuple(min((a * v + b) % MERSENNE_PRIME for v in values) for a, b in self._perms)
+
+def _expand_to_sentence(text: str, start: int, end: int) -> Tuple[int, int]:
+    sentence_start = max(text.rfind(c, 0, start) for c in ".!?") + 1
+    while sentence_start < start and text[sentence_start].isspace():
+        sentence_start += 1
+
+    ends = [i for i in (text.find(c, max(start, end - 1)) for c in ".!?") if i != -1]
+    sentence_end = min(ends) + 1 if ends else len(text)
+
+    return sentence_start, max(sentence_end, end)
+
+def realign(old_text: str, new_text: str,
+            errors: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]]]:
+    """Map errors found in old_text onto new_text with a word-level diff.
+
+    Returns the errors whose span survived unchanged (with shifted offsets
+    and wrong_version re-checked against the new text) and the
+    sentence-level regions of new_text that changed and need a fresh
+    analysis."""
+    old_tokens, new_tokens = tokenize(old_text), tokenize(new_text)
+    matcher = SequenceMatcher(None, [t[0] for t in old_tokens], [t[0] for t in new_tokens], autojunk=False)
+
+    # old token index -> new token index for every unchanged token
+    token_map: Dict[int, int] = {}
+    regions: List[Tuple[int, int]] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                token_map[i1 + k] = j1 + k
+            continue
+
+        if j1 < j2:
+            start, end = new_tokens[j1][1], new_tokens[j2 - 1][2]
+        elif new_tokens:
+            # pure deletion: re-check the sentence around where the words were
+            anchor = new_tokens[min(j1, len(new_tokens) - 1)]
+            start, end = anchor[1], anchor[2]
+        else:
+            continue
+        regions.append(_expand_to_sentence(new_text, start, end))
+
+    merged_regions: List[Tuple[int, int]] = []
+    for start, end in sorted(regions):
+        if merged_regions and start <= merged_regions[-1][1]:
+            merged_regions[-1] = (merged_regions[-1][0], max(merged_regions[-1][1], end))
+        else:
+            merged_regions.append((start, end))
+
+    realigned = []
+    for error in errors:
+        covered = [i for i, (_, s, e) in enumerate(old_tokens) if s < error["end"] and e > error["start"]]
+        if not covered or any(i not in token_map for i in covered):
+            continue
+
+        first, last = old_tokens[covered[0]], old_tokens[covered[-1]]
+        new_first, new_last = new_tokens[token_map[covered[0]]], new_tokens[token_map[covered[-1]]]
+        start = new_first[1] + (error["start"] - first[1])
+        end = new_last[2] - (last[2] - error["end"])
+
+        if new_text[start:end] != error["wrong_version"]:
+            continue
+        if any(start < r_end and end > r_start for r_start, r_end in merged_regions):
+            continue
+
+        realigned.append({**error, "start": start, "end": end})
+
+    return realigned, merged_regions
+
+class NearDuplicateIndex:
+    """MinHash LSH index of previously analyzed transcripts, scoped per
+    topic. Bands and rows are derived from min_similarity and candidates
+    are confirmed with the exact shingle Jaccard similarity."""
+
+    def __init__(self, grammar_checker: "GrammarChecker", min_similarity: float = NEAR_DUP_MIN_SIMILARITY,
+                 max_changed_fraction: float = NEAR_DUP_MAX_CHANGED_FRACTION,
+                 num_perm: int = NEAR_DUP_NUM_PERM, max_entries: int = NEAR_DUP_MAX_ENTRIES,
+                 max_topics: int = NEAR_DUP_MAX_TOPICS):
+        self.grammar_checker = grammar_checker
+        self.min_similarity = min_similarity
+        self.max_changed_fraction = max_changed_fraction
+        self.max_entries = max_entries
+        self.max_topics = max_topics
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_parameters(num_perm, min_similarity)
+        self._topics: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "lookups": 0, "hits": 0, "exact_hits": 0, "lookup_seconds": 0.0,
+            "reused_errors": 0, "dropped_errors": 0, "regions_reanalyzed": 0,
+            "too_many_changes": 0
+        }
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _topic_key(self, topic: str) -> str:
+        return " ".join(topic.lower().split())
+
+    def lookup(self, topic: str, text: str) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        shingle_set = shingles(text)
+        signature = self.hasher.signature(shingle_set)
+
+        with self._lock:
+            key = self._topic_key(topic)
+            scope = self._topics.get(key)
+            best = None
+            if scope is not None:
+                self._topics.move_to_end(key)
+
+                candidates = set()
+                for band_key in self._band_keys(signature):
+                    candidates.update(scope["buckets"].get(band_key, ()))
+
+                for entry_id in candidates:
+                    entry = scope["entries"][entry_id]
+                    similarity = jaccard(shingle_set, entry["shingles"])
+                    if similarity >= self.min_similarity and (best is None or similarity > best[0]):
+                        best = (similarity, entry)
+
+            self._stats["lookups"] += 1
+            self._stats["lookup_seconds"] += time.perf_counter() - start
+
+        return best[1] if best is not None else None
+
+    def add(self, topic: str, text: str, result: Dict[str, Any]) -> None:
+        shingle_set = shingles(text)
+        signature = self.hasher.signature(shingle_set)
+
+        with self._lock:
+            key = self._topic_key(topic)
+            scope = self._topics.get(key)
+            if scope is None:
+                scope = self._topics[key] = {"entries": OrderedDict(), "buckets": {}}
+                while len(self._topics) > self.max_topics:
+                    self._topics.popitem(last=False)
+            self._topics.move_to_end(key)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            scope["entries"][entry_id] = {
+                "signature": signature, "shingles": shingle_set, "text": text, "result": result
+            }
+            for band_key in self._band_keys(signature):
+                scope["buckets"].setdefault(band_key, []).append(entry_id)
+
+            while len(scope["entries"]) > self.max_entries:
+                old_id, old_entry = scope["entries"].popitem(last=False)
+                for band_key in self._band_keys(old_entry["signature"]):
+                    scope["buckets"][band_key].remove(old_id)
+                    if not scope["buckets"][band_key]:
+                        del scope["buckets"][band_key]
+
+    def remember(self, topic: str, text: str, result: Dict[str, Any]) -> None:
+        """Add a freshly analyzed transcript unless its result is partial or degraded."""
+        if not result["partial"] and not result["degraded"]:
+            self.add(topic, text, {**result, "errors": [dict(error) for error in result["errors"]]})
+
+    def reuse(self, topic: str, text: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """Return an analysis of text built from a near-duplicate's result,
+        re-analyzing only the sentence that changed, or None when a fresh
+        analysis is cheaper (a miss, or changes in several places)."""
+        entry = self.lookup(topic, text)
+        if entry is None:
+            return None
+
+        cached = entry["result"]
+        if entry["text"] == text:
+            with self._lock:
+                self._stats["hits"] += 1
+                self._stats["exact_hits"] += 1
+            return {**cached, "topic": topic, "errors": [dict(error) for error in cached["errors"]]}
+
+        errors, regions = realign(entry["text"], text, cached["errors"])
+
+        # each region would cost a full round trip with the whole prompt
+        # prefix, so more than one is no cheaper than a fresh analysis
+        changed = sum(end - start for start, end in regions)
+        if len(regions) > 1 or changed > self.max_changed_fraction * len(text):
+            with self._lock:
+                self._stats["too_many_changes"] += 1
+            return None
+
+        reused_count = len(errors)
+        partial = False
+        degraded = False
+        for start, end in regions:
+            try:
+                region_analysis = self.grammar_checker.analyze_grammar(text[start:end], deadline)
+            except DeadlineExceeded:
+                partial = True
+                break
+
+            degraded = region_analysis["degraded"]
+            for error in region_analysis["errors"]:
+                shifted = {**error, "start": error["start"] + start, "end": error["end"] + start}
+                if span_matches(text, shifted["start"], shifted["end"], str(shifted["wrong_version"])):
+                    errors.append(shifted)
+
+        errors = merge_overlapping_errors(errors)
+
+        # the cached feedback may describe errors that no longer apply
+        grammar_feedback = cached["grammar_feedback"]
+        if reused_count != len(cached["errors"]) or len(errors) != reused_count:
+            grammar_feedback = self.grammar_checker.feedback_for(text, errors)
+
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["reused_errors"] += reused_count
+            self._stats["dropped_errors"] += len(cached["errors"]) - reused_count
+            self._stats["regions_reanalyzed"] += len(regions)
+
+        return {
+            **cached,
+            "topic": topic,
+            "errors": errors,
+            "grammar_feedback": grammar_feedback,
+            "partial": partial,
+            "degraded": degraded
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            topics = len(self._topics)
+            entries = sum(len(scope["entries"]) for scope in self._topics.values())
+
+        lookup_seconds = stats.pop("lookup_seconds")
+        return {
+            "enabled": NEAR_DUP_ENABLED,
+            "bands": self.bands,
+            "rows": self.rows,
+            "topics": topics,
+            "entries": entries,
+            **stats,
+            "hit_rate": stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0,
+            "avg_lookup_ms": lookup_seconds / stats["lookups"] * 1000 if stats["lookups"] else 0.0
+        }
@@ -0,0 +1,127 @@
+import os
+import threading
+from typing import Dict, List, Any, Tuple, Callable, Optional
+from app.llm_service import LLMService
+from app.grammar_checker import GrammarChecker
+from app.coherence_analyzer import CoherenceAnalyzer
+from app.prompts import PACKED_TEMPLATE, estimate_tokens, render_packed_item
+from app.deadline import Deadline
+from app.near_duplicate import NearDuplicateIndex
+
+PACKING_ENABLED = os.getenv("LLM_PACKING_ENABLED", "false").lower() == "true"
+PACKING_TOKEN_BUDGET = int(os.getenv("LLM_PACKING_TOKEN_BUDGET", "3000"))
+PACKING_MAX_ITEM_TOKENS = int(os.getenv("LLM_PACKING_MAX_ITEM_TOKENS", "500"))
+PACKING_MAX_ITEMS = int(os.getenv("LLM_PACKING_MAX_ITEMS", "8"))
+
+def pack_transcripts(items: List[Tuple[str, str]],
+                     token_budget: int = PACKING_TOKEN_BUDGET,
+                     max_item_tokens: int = PACKING_MAX_ITEM_TOKENS,
+                     max_items: int = PACKING_MAX_ITEMS) -> Tuple[List[List[int]], List[int]]:
+    """Group (topic, paragraph) items into batches whose packed prompt stays
+    within token_budget. Returns the batches of item indices and the indices
+    of items too long to be worth packing."""
+    batches: List[List[int]] = []
+    single: List[int] = []
+
+    current: List[int] = []
+    current_tokens = PACKED_TEMPLATE.prefix_tokens
+
+    for i, (topic, paragraph) in enumerate(items):
+        item_tokens = estimate_tokens(render_packed_item(str(i), topic, paragraph))
+        if item_tokens > max_item_tokens:
+            single.append(i)
+            continue
+
+        if current and (current_tokens + item_tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            current_tokens = PACKED_TEMPLATE.prefix_tokens
+
+        current.append(i)
+        current_tokens += item_tokens
+
+    if current:
+        batches.append(current)
+
+    # a batch of one saves nothing over the regular per-transcript prompts
+    for batch in [b for b in batches if len(b) == 1]:
+        batches.remove(batch)
+        single.extend(batch)
+
+    return batches, sorted(single)
+
+class TranscriptPacker:
+    def __init__(self, grammar_checker: GrammarChecker, coherence_analyzer: CoherenceAnalyzer,
+                 analyze_single: Callable[[str, str, Optional[Deadline]], Dict[str, Any]],
+                 near_duplicates: Optional[NearDuplicateIndex] = None):
+        self.llm_service = LLMService()
+        self.grammar_checker = grammar_checker
+        self.coherence_analyzer = coherence_analyzer
+        self.analyze_single = analyze_single
+        self.near_duplicates = near_duplicates
+        self.packed_items = 0
+        self.fallback_items = 0
+        self._lock = threading.Lock()
+
+    def analyze(self, items: List[Tuple[str, str]], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = [None] * len(items)
+
+        # only transcripts without a near-duplicate to reuse need the LLM
+        misses = list(range(len(items)))
+        if self.near_duplicates is not None:
+            misses = []
+            for i, (topic, paragraph) in enumerate(items):
+                results[i] = self.near_duplicates.reuse(topic, paragraph, deadline)
+                if results[i] is None:
+                    misses.append(i)
+
+        batches, single = pack_transcripts([items[i] for i in misses])
+        batches = [[misses[j] for j in batch] for batch in batches]
+        single = [misses[j] for j in single]
+
+        for batch in batches:
+            try:
+                sections = self.llm_service.analyze_packed(
+                    [(str(i), items[i][0], items[i][1]) for i in batch],
+                    deadline
+                )
+            except Exception as e:
+                print(f"Error in packed analysis: {str(e)}")
+                sections = {}
+
+            for i in batch:
+                section = sections.get(str(i))
+                if section is None:
+                    single.append(i)
+                    with self._lock:
+                        self.fallback_items += 1
+                    continue
+
+                errors, grammar_feedback = self.grammar_checker.process_result(section)
+                coherence_analysis = self.coherence_analyzer.process_result(section)
+
+                results[i] = {
+                    "topic": items[i][0],
+                    "errors": errors,
+                    "grammar_feedback": grammar_feedback,
+                    "coherence_feedback": coherence_analysis["feedback"],
+                    "partial": False,
+                    "degraded": False
+                }
+                if self.near_duplicates is not None:
+                    self.near_duplicates.remember(items[i][0], items[i][1], results[i])
+                with self._lock:
+                    self.packed_items += 1
+
+        for i in single:
+            results[i] = self.analyze_single(items[i][0], items[i][1], deadline)
+
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": PACKING_ENABLED,
+                "packed_items": self.packed_items,
+                "fallback_items": self.fallback_items
+            }
@@ -0,0 +1,127 @@
+import re
+import threading
+from typing import Dict, List, Any
+
+# Bump when the wording of any template changes so cached results and usage
+# stats from older prompts can be told apart.
+PROMPT_VERSION = "2"
+
+# Rough chars-per-token ratio for English text with the OpenAI tokenizers.
+CHARS_PER_TOKEN = 4
+
+# OpenAI only caches prompts of at least this many tokens. The templates
+# below are shorter, so cached_tokens stays 0 until a prefix grows past it.
+PROVIDER_CACHE_MIN_TOKENS = 1024
+
+def normalize_whitespace(text: str) -> str:
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines))
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+class PromptTemplate:
+    """A prompt whose static instructions and schema form a fixed prefix
+    (the system message) with the per-call user content appended last, so
+    the provider can cache the prefix across calls."""
+
+    def __init__(self, name: str, instructions: str, user_format: str):
+        self.name = name
+        self.version = PROMPT_VERSION
+        self.prefix = normalize_whitespace(instructions)
+        self.user_format = user_format
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.cacheable = self.prefix_tokens >= PROVIDER_CACHE_MIN_TOKENS
+
+    def render(self, **fields: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.prefix},
+            {"role": "user", "content": self.user_format.format(**fields).strip()}
+        ]
+
+    def estimate_tokens(self, **fields: str) -> int:
+        return sum(estimate_tokens(message["content"]) for message in self.render(**fields))
+
+GRAMMAR_TEMPLATE = PromptTemplate(
+    "grammar",
+    """
+    You are a TOEFL grammar expert that analyzes text and returns JSON.
+    Identify all grammatical errors in the TEXT given by the user. For each error, provide:
+    1. The start and end index of the error in the text
+    2. The incorrect text
+    3. The corrected version
+    4. A brief explanation of the error
+    Ensure that the indices are correct by counting characters from the beginning of the text (0-indexed).
+    Respond with a single valid JSON object with this structure and nothing else:
+    {"errors": [{"start": <start_index>, "end": <end_index>, "wrong_version": "<incorrect_text>", "correct_version": "<corrected_text>", "explanation": "<brief_explanation>"}], "grammar_feedback": "<overall_feedback_on_grammar>", "confidence": <your_confidence_in_this_analysis_between_0_and_1>}
+    """,
+    "TEXT:\n{text}"
+)
+
+COHERENCE_TEMPLATE = PromptTemplate(
+    "coherence",
+    """
+    You are a TOEFL coherence expert that analyzes text and returns JSON.
+    Evaluate how well the TEXT given by the user flows, whether ideas connect logically, and if it stays on the TOPIC. Consider:
+    1. Logical flow between sentences and paragraphs
+    2. Use of transition words and phrases
+    3. Overall organization and structure
+    4. Relevance to the given topic
+    5. Repetition and redundancy
+    The coherence_feedback should be detailed enough to help the student improve their writing.
+    Respond with a single valid JSON object with this structure and nothing else:
+    {"coherence_feedback": "<detailed_feedback_on_coherence>", "score": <coherence_score_between_0_and_1>, "confidence": <your_confidence_in_this_analysis_between_0_and_1>}
+    """,
+    "TOPIC: {topic}\nTEXT:\n{text}"
+)
+
+PACKED_TEMPLATE = PromptTemplate(
+    "packed",
+    """
+    You are a TOEFL grammar and coherence expert that analyzes text and returns JSON.
+    The user sends several ITEMs, each with an id, a TOPIC and a TEXT. Analyze every item independently.
+    For grammar, identify all grammatical errors in the item's TEXT with the start and end index (0-indexed characters from the beginning of that item's TEXT), the incorrect text, the corrected version and a brief explanation.
+    For coherence, evaluate logical flow, use of transitions, organization, relevance to the item's TOPIC, and repetition, with feedback detailed enough to help the student improve.
+    Respond with a single valid JSON object with this structure and nothing else, with exactly one entry per item id:
+    {"items": [{"id": "<item_id>", "errors": [{"start": <start_index>, "end": <end_index>, "wrong_version": "<incorrect_text>", "correct_version": "<corrected_text>", "explanation": "<brief_explanation>"}], "grammar_feedback": "<overall_feedback_on_grammar>", "coherence_feedback": "<detailed_feedback_on_coherence>", "score": <coherence_score_between_0_and_1>}]}
+    """,
+    "{items}"
+)
+
+def render_packed_item(item_id: str, topic: str, text: str) -> str:
+    return f"[ITEM id={item_id}]\nTOPIC: {topic}\nTEXT:\n{text}\n[END ITEM id={item_id}]"
+
+class PromptUsage:
+    """Per-template input token accounting, comparing our estimate with the
+    provider-reported prompt and cached tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def record(self, template: PromptTemplate, estimated_tokens: int,
+               prompt_tokens: int, cached_tokens: int) -> None:
+        with self._lock:
+            usage = self._usage.setdefault(template.name, {
+                "prefix_tokens": template.prefix_tokens,
+                "cacheable": template.cacheable,
+                "calls": 0, "estimated_tokens": 0, "prompt_tokens": 0, "cached_tokens": 0
+            })
+            usage["calls"] += 1
+            usage["estimated_tokens"] += estimated_tokens
+            usage["prompt_tokens"] += prompt_tokens
+            usage["cached_tokens"] += cached_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": PROMPT_VERSION,
+                "templates": {
+                    name: {
+                        **usage,
+                        "avg_prompt_tokens": usage["prompt_tokens"] / usage["calls"] if usage["calls"] else 0.0,
+                        "cache_hit_ratio": usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0
+                    }
+                    for name, usage in self._usage.items()
+                }
+            }
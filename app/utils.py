@@ -1,5 +1,5 @@
 import re
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
 
 def find_indices(text: str, error_text: str) -> Tuple[int, int]:
     start = text.find(error_text)
@@ -13,6 +13,26 @@ def find_indices(text: str, error_text: str) -> Tuple[int, int]:
     
     return start, start + len(error_text)
 
+def span_matches(text: str, start: int, end: int, wrong_version: str) -> bool:
+    if start < 0 or end > len(text) or start >= end:
+        return False
+    
+    # tolerate case and whitespace differences in the model's wrong_version
+    return " ".join(text[start:end].split()).lower() == " ".join(wrong_version.split()).lower()
+
+def locate_span(text: str, start: int, end: int, wrong_version: str) -> Optional[Tuple[int, int]]:
+    """Return the span of wrong_version in text, trusting start and end when
+    they match and otherwise taking the occurrence nearest to start."""
+    if span_matches(text, start, end, wrong_version):
+        return start, end
+    
+    matches = [m.start() for m in re.finditer(re.escape(wrong_version), text, re.IGNORECASE)] if wrong_version else []
+    if not matches:
+        return None
+    
+    nearest = min(matches, key=lambda position: abs(position - start))
+    return nearest, nearest + len(wrong_version)
+
 def format_error(text: str, start: int, end: int, correction: str) -> Dict[str, Any]:
     return {
         "start": start,
@@ -0,0 +1,86 @@
+import pytest
+from app.cascade import ModelCascade
+from app.deadline import Deadline
+
+def validate(result):
+    if "errors" not in result:
+        return "invalid_schema"
+    if result.get("confidence", 1.0) < 0.7:
+        return "low_confidence"
+    return None
+
+def run(cascade, responses, text_length=100, deadline=None):
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        response = responses[model]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return cascade.run(text_length, call, validate, deadline), calls
+
+def make_cascade():
+    return ModelCascade(["fast", "strong"], max_chars=1000, min_confidence=0.7)
+
+def test_accepted_fast_result_is_not_escalated():
+    cascade = make_cascade()
+    result, calls = run(cascade, {"fast": {"errors": []}, "strong": {"errors": ["x"]}})
+
+    assert result == {"errors": []}
+    assert calls == ["fast"]
+    fast = cascade.stats()["tiers"][0]
+    assert (fast["calls"], fast["accepted"], fast["escalated"]) == (1, 1, 0)
+
+@pytest.mark.parametrize("fast_response, reason", [
+    (None, "invalid_json"),
+    ({"grammar_feedback": "ok"}, "invalid_schema"),
+    ({"errors": [], "confidence": 0.2}, "low_confidence")
+])
+def test_rejected_fast_result_escalates(fast_response, reason):
+    cascade = make_cascade()
+    result, calls = run(cascade, {"fast": fast_response, "strong": {"errors": []}})
+
+    assert result == {"errors": []}
+    assert calls == ["fast", "strong"]
+    fast, strong = cascade.stats()["tiers"]
+    assert fast["escalated"] == 1
+    assert fast["escalation_reasons"] == {reason: 1}
+    assert strong["accepted"] == 1
+
+def test_long_input_skips_to_the_strong_tier():
+    cascade = make_cascade()
+    _, calls = run(cascade, {"fast": {"errors": []}, "strong": {"errors": []}}, text_length=5000)
+
+    assert calls == ["strong"]
+    assert cascade.stats()["long_input_skips"] == 1
+
+def test_failed_escalation_returns_the_cheaper_result():
+    cascade = make_cascade()
+    cheap = {"errors": [], "confidence": 0.2}
+    result, calls = run(cascade, {"fast": cheap, "strong": RuntimeError("boom")})
+
+    assert result == cheap
+    assert calls == ["fast", "strong"]
+
+def test_failure_on_the_first_tier_is_raised():
+    with pytest.raises(RuntimeError):
+        run(make_cascade(), {"fast": RuntimeError("boom"), "strong": {"errors": []}})
+
+def test_expired_deadline_keeps_the_cheaper_result():
+    cascade = make_cascade()
+    cheap = {"errors": [], "confidence": 0.2}
+    result, calls = run(cascade, {"fast": cheap, "strong": {"errors": []}}, deadline=Deadline(0))
+
+    assert result == cheap
+    assert calls == ["fast"]
+
+def test_invalid_last_tier_result_counts_as_rejected():
+    cascade = make_cascade()
+    result, _ = run(cascade, {"fast": None, "strong": {"confidence": 0.9}})
+
+    assert result == {"confidence": 0.9}
+    strong = cascade.stats()["tiers"][1]
+    assert (strong["calls"], strong["accepted"], strong["rejected"], strong["escalated"]) == (1, 0, 1, 0)
+    assert strong["hit_rate"] == 0.0
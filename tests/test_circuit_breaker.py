@@ -0,0 +1,104 @@
+import time
+import asyncio
+import pytest
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from app.deadline import Deadline, DeadlineExceeded
+
+class ClientError(Exception):
+    pass
+
+def make_breaker(**overrides):
+    settings = dict(enabled=True, window=10, min_calls=4, failure_rate=0.5,
+                    slow_call_seconds=10, slow_call_rate=0.8, open_seconds=0.05,
+                    is_failure=lambda error: not isinstance(error, ClientError))
+    settings.update(overrides)
+    return CircuitBreaker(**settings)
+
+def fail(breaker, error=None, deadline=None):
+    def call():
+        raise error or RuntimeError("provider down")
+    with pytest.raises(Exception):
+        breaker.call(call, deadline)
+
+def test_trips_on_failure_rate():
+    breaker = make_breaker()
+    breaker.call(lambda: "ok")
+    breaker.call(lambda: "ok")
+    fail(breaker)
+    assert breaker.state == CLOSED
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 1
+
+def test_trips_on_slow_call_rate():
+    breaker = make_breaker(slow_call_seconds=0.01, slow_call_rate=0.5)
+    for _ in range(4):
+        breaker.call(lambda: time.sleep(0.02))
+
+    assert breaker.state == OPEN
+
+def test_rejects_calls_while_open():
+    breaker = make_breaker(min_calls=1)
+    fail(breaker)
+
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+    assert breaker.stats()["rejected"] == 1
+
+def test_single_probe_when_half_open():
+    breaker = make_breaker(min_calls=1)
+    fail(breaker)
+    time.sleep(0.06)
+
+    is_probe, start = breaker.acquire()
+    assert is_probe and breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    breaker.release(is_probe, start)
+    assert breaker.state == CLOSED
+
+def test_failed_probe_reopens():
+    breaker = make_breaker(min_calls=1)
+    fail(breaker)
+    time.sleep(0.06)
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 2
+
+def test_deadline_errors_are_not_counted():
+    breaker = make_breaker(min_calls=1)
+    fail(breaker, DeadlineExceeded("budget spent"))
+    fail(breaker, RuntimeError("timed out"), Deadline(0))
+
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_calls"] == 0
+
+def test_client_errors_are_not_counted():
+    breaker = make_breaker(min_calls=1)
+    fail(breaker, ClientError("context length exceeded"))
+
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_calls"] == 0
+
+@pytest.mark.parametrize("error", [asyncio.CancelledError(), ClientError("bad request")])
+def test_neutral_outcome_frees_the_probe(error):
+    breaker = make_breaker(min_calls=1)
+    fail(breaker)
+    time.sleep(0.06)
+
+    is_probe, start = breaker.acquire()
+    breaker.release(is_probe, start, error)
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire()[0]
+
+def test_disabled_breaker_never_trips():
+    breaker = make_breaker(enabled=False, min_calls=1)
+    fail(breaker)
+    fail(breaker)
+
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
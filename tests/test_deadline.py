@@ -0,0 +1,25 @@
+import time
+import pytest
+from app import deadline as deadline_module
+from app.deadline import Deadline, DeadlineExceeded
+
+def test_remaining_counts_down_and_expires():
+    deadline = Deadline(0.05)
+
+    assert 0 < deadline.remaining() <= 0.05
+    assert not deadline.expired()
+    time.sleep(0.06)
+    assert deadline.remaining() == 0.0
+    assert deadline.expired()
+
+def test_check_raises_once_expired():
+    assert Deadline(1).check() > 0
+    with pytest.raises(DeadlineExceeded):
+        Deadline(0).check()
+
+def test_from_ms_defaults_to_and_is_capped_at_the_server_limit(monkeypatch):
+    monkeypatch.setattr(deadline_module, "REQUEST_DEADLINE_MS", 2000)
+
+    assert 1.9 < Deadline.from_ms().remaining() <= 2.0
+    assert 1.9 < Deadline.from_ms(10 ** 9).remaining() <= 2.0
+    assert 0.4 < Deadline.from_ms(500).remaining() <= 0.5
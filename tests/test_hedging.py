@@ -0,0 +1,102 @@
+import time
+import threading
+import pytest
+from app.deadline import Deadline, DeadlineExceeded
+from app.hedging import HedgedExecutor, LatencyTracker
+
+def warmed_executor(max_workers=4):
+    executor = HedgedExecutor(enabled=True, percentile=95, min_samples=3, max_workers=max_workers)
+    for _ in range(3):
+        executor.run("model:grammar", lambda timeout: time.sleep(0.02))
+    return executor
+
+def sequenced(*behaviours):
+    """A call whose n-th invocation sleeps and then returns or raises."""
+    lock = threading.Lock()
+    attempts = []
+
+    def call(timeout):
+        with lock:
+            behaviour = behaviours[len(attempts)]
+            attempts.append(timeout)
+        delay, outcome = behaviour
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call, attempts
+
+def test_percentile():
+    tracker = LatencyTracker()
+    for latency in range(1, 101):
+        tracker.record(latency / 100)
+
+    assert tracker.percentile(50) == 0.51
+    assert tracker.percentile(95) == 0.95
+    assert len(tracker) == 100
+
+def test_no_hedge_before_enough_samples():
+    executor = HedgedExecutor(enabled=True, min_samples=3)
+    call, attempts = sequenced((0.05, "only"))
+
+    assert executor.run("k", call, Deadline(1)) == "only"
+    assert len(attempts) == 1
+    assert 0 < attempts[0] <= 1
+    assert executor.stats()["hedges"] == 0
+
+def test_hedge_fires_after_the_percentile_and_wins():
+    executor = warmed_executor()
+    call, attempts = sequenced((1.0, "primary"), (0.0, "hedge"))
+
+    start = time.perf_counter()
+    assert executor.run("model:grammar", call) == "hedge"
+    assert time.perf_counter() - start < 0.5
+    assert len(attempts) == 2
+    stats = executor.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+def test_first_success_wins_over_a_failed_hedge():
+    executor = warmed_executor()
+    call, _ = sequenced((0.2, "primary"), (0.0, RuntimeError("boom")))
+
+    assert executor.run("model:grammar", call) == "primary"
+    assert executor.stats()["hedge_wins"] == 0
+
+def test_error_is_raised_when_every_attempt_fails():
+    executor = warmed_executor()
+    call, _ = sequenced((0.1, RuntimeError("primary")), (0.0, RuntimeError("hedge")))
+
+    with pytest.raises(RuntimeError):
+        executor.run("model:grammar", call)
+
+def test_deadline_exceeded_while_waiting():
+    executor = warmed_executor()
+    call, _ = sequenced((1.0, "primary"), (1.0, "hedge"))
+
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        executor.run("model:grammar", call, Deadline(0.2))
+    assert time.perf_counter() - start < 0.5
+    assert executor.stats()["deadline_exceeded"] == 1
+
+def test_expired_deadline_skips_the_call():
+    executor = HedgedExecutor(enabled=False)
+    call, attempts = sequenced((0.0, "unused"))
+
+    with pytest.raises(DeadlineExceeded):
+        executor.run("k", call, Deadline(0))
+    assert attempts == []
+
+def test_hedge_is_skipped_when_every_worker_is_busy():
+    executor = warmed_executor(max_workers=1)
+    call, _ = sequenced((0.3, "a"), (0.3, "b"), (0.3, "c"), (0.3, "d"))
+
+    threads = [threading.Thread(target=executor.run, args=("model:grammar", call)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = executor.stats()
+    assert (stats["hedges"], stats["hedges_skipped"]) == (1, 1)
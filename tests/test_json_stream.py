@@ -0,0 +1,64 @@
+import json
+from app.json_stream import ErrorStreamParser
+
+def feed_in_chunks(document: str, size: int):
+    parser = ErrorStreamParser()
+    emitted = []
+    for i in range(0, len(document), size):
+        for item in parser.feed(document[i:i + size]):
+            emitted.append((i + size, item))
+    return parser, emitted
+
+def test_yields_each_error_before_the_document_ends():
+    document = json.dumps({
+        "errors": [
+            {"start": 0, "end": 2, "wrong_version": "He", "correct_version": "She"},
+            {"start": 3, "end": 5, "wrong_version": "go", "correct_version": "goes"}
+        ],
+        "grammar_feedback": "x" * 200
+    })
+    parser, emitted = feed_in_chunks(document, 4)
+
+    assert [item["correct_version"] for _, item in emitted] == ["She", "goes"]
+    assert all(position < len(document) - 200 for position, _ in emitted)
+    assert parser.array_closed
+    assert parser.result()["grammar_feedback"] == "x" * 200
+
+def test_braces_brackets_and_escapes_inside_strings():
+    errors = [
+        {"start": 1, "end": 4, "wrong_version": "a}b", "correct_version": "{[", "explanation": 'say \\"hi\\" ]'},
+        {"start": 5, "end": 6, "wrong_version": "\\\\", "correct_version": "x", "nested": {"k": [1, {}]}}
+    ]
+    document = json.dumps({"note": "errors: [{\"}", "errors": errors, "grammar_feedback": "ok"})
+
+    for size in (1, 3, 7, len(document)):
+        _, emitted = feed_in_chunks(document, size)
+        assert [item for _, item in emitted] == errors
+
+def test_key_split_across_chunks():
+    document = '{"err' + 'ors": [{"start": 1, "end"' + ': 2, "wrong_version": "a", "correct_version": "b"}]}'
+    parser = ErrorStreamParser()
+    items = []
+    for chunk in ['{"err', 'ors": [{"start": 1, "end"', ': 2, "wrong_version": "a", "correct_version": "b"}]}']:
+        items += parser.feed(chunk)
+
+    assert items == [{"start": 1, "end": 2, "wrong_version": "a", "correct_version": "b"}]
+    assert parser.result() == json.loads(document)
+
+def test_fenced_output_and_other_arrays_are_ignored():
+    body = json.dumps({
+        "other": [{"start": 9}],
+        "errors": [{"start": 1, "end": 2, "wrong_version": "a", "correct_version": "b"}],
+        "later": {"errors": [{"start": 7}]}
+    })
+    parser, emitted = feed_in_chunks("```json\n" + body + "\n```", 5)
+
+    assert [item for _, item in emitted] == [{"start": 1, "end": 2, "wrong_version": "a", "correct_version": "b"}]
+    assert parser.result()["later"] == {"errors": [{"start": 7}]}
+
+def test_incomplete_document_has_no_result():
+    parser = ErrorStreamParser()
+    items = parser.feed('{"errors": [{"start": 1, "end": 2, "wrong_version": "a", "correct_version": "b"}, {"start": ')
+
+    assert len(items) == 1
+    assert parser.result() is None
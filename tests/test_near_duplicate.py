@@ -0,0 +1,118 @@
+from app.near_duplicate import MinHasher, NearDuplicateIndex, jaccard, lsh_parameters, realign, shingles
+
+BASE = (
+    "I think students should work part time while studying. It teaches them how to manage money. "
+    "They also learn to plan their days and meet deadlines at work. Employers value this experience "
+    "when they hire graduates. However, too many hours can hurt their grades, so a balance is important. "
+    "In my opinion a few hours each week is the best choice for most students in college today."
+)
+
+class StubGrammarChecker:
+    def __init__(self, errors=None):
+        self.errors = errors or []
+        self.calls = []
+
+    def analyze_grammar(self, text, deadline=None):
+        self.calls.append(text)
+        return {"errors": [dict(error) for error in self.errors], "feedback": "region", "degraded": False}
+
+    def feedback_for(self, text, errors):
+        return f"{len(errors)} errors"
+
+def cached_result(errors):
+    return {"topic": "Work", "errors": errors, "grammar_feedback": "cached", "coherence_feedback": "ok",
+            "partial": False, "degraded": False}
+
+def error_at(text, wrong, correct):
+    start = text.index(wrong)
+    return {"start": start, "end": start + len(wrong), "wrong_version": wrong, "correct_version": correct}
+
+def test_minhash_estimates_shingle_jaccard():
+    hasher = MinHasher(256)
+    near = BASE.replace("manage money", "save money")
+    far = "Living in a big city offers many cultural events, museums and restaurants for everyone to enjoy."
+
+    for other in (near, far):
+        a, b = shingles(BASE), shingles(other)
+        sig_a, sig_b = hasher.signature(a), hasher.signature(b)
+        estimate = sum(x == y for x, y in zip(sig_a, sig_b)) / 256
+        assert abs(estimate - jaccard(a, b)) < 0.1
+
+    assert jaccard(shingles(BASE), shingles(near)) > 0.8
+    assert jaccard(shingles(BASE), shingles(far)) == 0.0
+
+def test_lsh_parameters_follow_min_similarity():
+    for threshold in (0.5, 0.6, 0.8, 0.9):
+        bands, rows = lsh_parameters(128, threshold)
+        assert bands * rows == 128
+        assert (1 / bands) ** (1 / rows) <= threshold
+
+    assert lsh_parameters(128, 0.9)[1] > lsh_parameters(128, 0.5)[1]
+
+def test_realign_shifts_errors_and_drops_changed_ones():
+    old = "He go to school. She have a cat. They is happy."
+    errors = [error_at(old, "go", "goes"), error_at(old, "have", "has"), error_at(old, "is", "are")]
+    new = "He go to school. She owns a big cat. They is happy."
+
+    realigned, regions = realign(old, new, errors)
+
+    assert [e["correct_version"] for e in realigned] == ["goes", "are"]
+    assert realigned[1]["start"] == errors[2]["start"] + 4
+    assert all(new[e["start"]:e["end"]] == e["wrong_version"] for e in realigned)
+    assert [new[s:e] for s, e in regions] == ["She owns a big cat."]
+
+def test_lookup_is_scoped_per_topic():
+    index = NearDuplicateIndex(StubGrammarChecker())
+    index.add("Work", BASE, cached_result([]))
+
+    near = BASE.replace("manage money", "save money")
+    assert index.lookup("  work ", near)["text"] == BASE
+    assert index.lookup("Cities", near) is None
+    assert index.lookup("Work", "A completely different answer about living in a big city.") is None
+
+def test_least_recently_used_topic_is_evicted():
+    index = NearDuplicateIndex(StubGrammarChecker(), max_topics=2)
+    index.add("a", BASE, cached_result([]))
+    index.add("b", BASE, cached_result([]))
+    index.lookup("a", BASE)
+    index.add("c", BASE, cached_result([]))
+
+    assert index.lookup("b", BASE) is None
+    assert index.lookup("a", BASE) is not None
+    assert index.stats()["topics"] == 2
+
+def test_reuse_reanalyzes_one_changed_sentence_and_refreshes_feedback():
+    errors = [error_at(BASE, "hurt", "harm")]
+    checker = StubGrammarChecker([{"start": 0, "end": 4, "wrong_version": "They", "correct_version": "Students"}])
+    index = NearDuplicateIndex(checker)
+    index.add("Work", BASE, cached_result(errors))
+
+    new = BASE.replace("plan their days", "plan the days")
+    result = index.reuse("Work", new)
+
+    assert checker.calls == ["They also learn to plan the days and meet deadlines at work."]
+    assert [e["correct_version"] for e in result["errors"]] == ["Students", "harm"]
+    assert all(new[e["start"]:e["end"]] == e["wrong_version"] for e in result["errors"])
+    assert result["grammar_feedback"] == "2 errors"
+
+def test_reuse_analyzes_fresh_when_several_places_changed():
+    checker = StubGrammarChecker()
+    index = NearDuplicateIndex(checker)
+    index.add("Work", BASE, cached_result([]))
+
+    new = BASE.replace("manage money", "save money").replace("best choice", "right choice")
+
+    assert index.reuse("Work", new) is None
+    assert checker.calls == []
+    assert index.stats()["too_many_changes"] == 1
+
+def test_exact_hit_makes_no_calls():
+    checker = StubGrammarChecker()
+    index = NearDuplicateIndex(checker)
+    index.add("Work", BASE, cached_result([error_at(BASE, "hurt", "harm")]))
+
+    result = index.reuse("Work", BASE)
+
+    assert checker.calls == []
+    assert result["grammar_feedback"] == "cached"
+    assert index.stats()["exact_hits"] == 1
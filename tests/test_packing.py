@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from app.coherence_analyzer import CoherenceAnalyzer
+from app.grammar_checker import GrammarChecker
+from app.near_duplicate import NearDuplicateIndex
+from app.packing import TranscriptPacker, pack_transcripts
+from app.prompts import PACKED_TEMPLATE, estimate_tokens, render_packed_item
+
+def item(length):
+    return ("Topic", "x" * length)
+
+def tokens(i, items):
+    return estimate_tokens(render_packed_item(str(i), *items[i]))
+
+def test_items_are_grouped_within_the_token_budget():
+    items = [item(200) for _ in range(5)]
+    budget = PACKED_TEMPLATE.prefix_tokens + 2 * tokens(0, items)
+
+    batches, single = pack_transcripts(items, token_budget=budget, max_item_tokens=1000, max_items=10)
+
+    assert batches == [[0, 1], [2, 3]]
+    assert single == [4]
+
+def test_batches_are_capped_at_max_items():
+    items = [item(10) for _ in range(7)]
+
+    batches, single = pack_transcripts(items, token_budget=100000, max_item_tokens=1000, max_items=3)
+
+    assert batches == [[0, 1, 2], [3, 4, 5]]
+    assert single == [6]
+
+def test_oversized_items_are_analyzed_alone():
+    items = [item(10), item(4000), item(10), item(10)]
+
+    batches, single = pack_transcripts(items, token_budget=100000, max_item_tokens=500, max_items=10)
+
+    assert batches == [[0, 2, 3]]
+    assert single == [1]
+
+def test_lone_batches_fall_back_to_single_calls():
+    items = [item(10), item(4000)]
+
+    batches, single = pack_transcripts(items, token_budget=100000, max_item_tokens=500, max_items=10)
+
+    assert batches == []
+    assert single == [0, 1]
+
+def test_packer_reuses_near_duplicates_and_packs_only_misses():
+    grammar_checker = GrammarChecker()
+    index = NearDuplicateIndex(grammar_checker)
+    single_calls = []
+    packer = TranscriptPacker(grammar_checker, CoherenceAnalyzer(),
+                              lambda topic, paragraph, deadline: single_calls.append(paragraph),
+                              index)
+
+    packed_calls = []
+
+    def analyze_packed(batch, deadline=None):
+        packed_calls.append([text for _, _, text in batch])
+        return {
+            item_id: {"errors": [], "grammar_feedback": "good", "coherence_feedback": "clear", "score": 0.8}
+            for item_id, _, _ in batch
+        }
+
+    packer.llm_service.analyze_packed = analyze_packed
+    texts = [("Work", f"Answer number {n} about part time jobs for students.") for n in range(3)]
+
+    first = packer.analyze(texts[:2])
+    second = packer.analyze(texts)
+
+    assert packed_calls == [[texts[0][1], texts[1][1]]]
+    assert single_calls == [texts[2][1]]
+    assert second[:2] == first
+    assert index.stats()["exact_hits"] == 2
+    assert index.stats()["entries"] == 2